@@ -0,0 +1,150 @@
+"""
+Numba-compiled kernels for the numerical hot paths
+
+These work on plain float64 arrays so they can be compiled in nopython mode;
+the public wrappers live in airfoil.py and structures.py.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def find_sign_change_nb(xs):
+    """ Returns the first i where xs falls then stops falling (xs[i] > xs[i+1] <= xs[i+2]), or -1 """
+    if xs.size < 3:
+        return -1
+    d2 = xs[1] - xs[0]
+    for i in range(xs.size - 2):
+        # each difference is computed once and reused as the next d1
+        d1 = d2
+        d2 = xs[i+2] - xs[i+1]
+        if d1 < 0.0 and d2 >= 0.0:
+            return i
+    return -1
+
+
+@njit(cache=True)
+def _interp_sorted(x, xp, fp, out):
+    """ np.interp for ascending x: walks xp once instead of bisecting per point """
+    n = xp.size
+    j = 0
+    for i in range(x.size):
+        xi = x[i]
+        if xi <= xp[0]:
+            out[i] = fp[0]
+        elif xi >= xp[n-1]:
+            out[i] = fp[n-1]
+        else:
+            while xp[j+1] < xi:
+                j += 1
+            out[i] = fp[j] + (fp[j+1] - fp[j]) * (xi - xp[j]) / (xp[j+1] - xp[j])
+
+
+@njit(cache=True)
+def surface_heights_nb(upper, lower, grid):
+    """ Heights of the upper and lower surfaces at each (ascending) grid point.
+    The upper surface runs from the trailing edge forward, the lower surface aft. """
+    y_upper = np.empty(grid.size)
+    y_lower = np.empty(grid.size)
+    _interp_sorted(grid, upper[::-1,0], upper[::-1,1], y_upper)
+    _interp_sorted(grid, lower[:,0], lower[:,1], y_lower)
+    return y_upper, y_lower
+
+
+@njit(cache=True)
+def thickness_nb(upper, lower, grid):
+    """ Maximum distance between the surfaces over the grid """
+    y_upper, y_lower = surface_heights_nb(upper, lower, grid)
+    return (y_upper - y_lower).max()
+
+
+@njit(cache=True)
+def cumtrapz_nb(y, x, out):
+    """ Cumulative trapezoidal integral of y over a (possibly non-uniform) grid x,
+    starting from 0, written into out (same length as y) """
+    acc = 0.0
+    out[0] = 0.0
+    for i in range(1, y.size):
+        acc += 0.5*(y[i] + y[i-1])*(x[i] - x[i-1])
+        out[i] = acc
+    return out
+
+
+# explicit signature: compiled (or loaded from cache) at import, no per-call
+# type dispatch; arrays must be C-contiguous float64
+@njit("f8(f8[::1], f8, f8, f8[::1], f8[::1], f8[::1], f8[::1])", cache=True, fastmath=True)
+def solve_beam_nb(loading, dz, EI, shear, moment, angle, disp):
+    """ Shear, moment, angle and displacement of a beam under loading, written
+    into the given arrays (all as long as loading) in a single pass; returns the
+    maximum moment. Shear and moment are zero at the free tip (index 0), angle
+    and displacement at the center. """
+    n = loading.size
+    h = 0.5*dz
+    # running trapezoid sums of each integral, from zero at the tip
+    s = m = a = d = 0.0
+    shear[0] = moment[0] = angle[0] = disp[0] = 0.0
+    max_moment = 0.0
+    for i in range(1, n):
+        s_prev, m_prev, a_prev = s, m, a
+        s += (loading[i-1] + loading[i]) * h
+        m += (s_prev + s) * h
+        a += (m_prev + m) * h
+        d += (a_prev + a) * h
+        shear[i] = s
+        moment[i] = m
+        angle[i] = a
+        disp[i] = d
+        if m > max_moment:
+            max_moment = m
+    # shift angle and displacement to zero at the center; the angle offset
+    # integrates to a linear term in the displacement
+    c = n//2
+    a_c = angle[c]
+    d_c = disp[c]
+    inv_EI = 1.0/EI
+    for i in range(n):
+        angle[i] = (angle[i] - a_c) * inv_EI
+        disp[i] = (disp[i] - d_c - a_c*(i - c)*dz) * inv_EI
+    return max_moment
+
+
+# beams per parallel task in solve_beams_nb: threads write separate runs of
+# 64 columns, which reduces false sharing (neighbouring blocks can still share
+# a cache line at their edges unless nbeams is a multiple of 8 and the arrays
+# are 64-byte aligned)
+_BEAM_BLOCK = 64
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def solve_beams_nb(loading, dz, EI, shear, moment, angle, disp, max_moment):
+    """ solve_beam_nb for many beams at once. Grid arrays have one column per
+    beam (z along axis 0); dz, EI and max_moment have one entry per beam.
+    Blocks of beams are solved in parallel, each walking z once with the
+    block's beams as the (contiguous) inner loop. """
+    n, nbeams = loading.shape
+    c = n//2
+    for block in prange((nbeams + _BEAM_BLOCK - 1)//_BEAM_BLOCK):
+        lo = block*_BEAM_BLOCK
+        hi = min(lo + _BEAM_BLOCK, nbeams)
+        for b in range(lo, hi):
+            shear[0, b] = moment[0, b] = angle[0, b] = disp[0, b] = 0.0
+            max_moment[b] = 0.0
+        for i in range(1, n):
+            for b in range(lo, hi):
+                h = 0.5*dz[b]
+                shear[i, b] = shear[i-1, b] + (loading[i-1, b] + loading[i, b]) * h
+                moment[i, b] = moment[i-1, b] + (shear[i-1, b] + shear[i, b]) * h
+                angle[i, b] = angle[i-1, b] + (moment[i-1, b] + moment[i, b]) * h
+                disp[i, b] = disp[i-1, b] + (angle[i-1, b] + angle[i, b]) * h
+                if moment[i, b] > max_moment[b]:
+                    max_moment[b] = moment[i, b]
+        # centre boundary conditions, as in solve_beam_nb
+        a_c = angle[c, lo:hi].copy()
+        d_c = disp[c, lo:hi].copy()
+        inv_EI = 1.0/EI[lo:hi]
+        for i in range(n):
+            for b in range(lo, hi):
+                k = b - lo
+                angle[i, b] = (angle[i, b] - a_c[k]) * inv_EI[k]
+                disp[i, b] = (disp[i, b] - d_c[k] - a_c[k]*(i - c)*dz[b]) * inv_EI[k]
@@ -0,0 +1,78 @@
+"""
+Filename patterns for the airfoil families in the UIUC database
+
+Everything is compiled once at import.
+"""
+
+import re
+
+filename_regexes = {
+    "ag (mark drela)":r"ag\d{2}(.*)?",
+    "althaus":        r"ah\d\d(.*)?",
+    "nasa ames":      r"ames\d\d",
+    "amsoil":         r"amsoil\d",
+    "arad: ":         r"arad\d{2}",
+    "ananda-selig":   r"as\d{4}",
+    "boeing":         r"b(7\d\d.)?(oe\d{3})?(ac.*)?",
+    "bambino":        r"e?bambino\d?",
+    "lockheed":       r"c(\d\w)?(\d{3}\w)?",
+    "clark":          r"clar[ky]\w+",
+    "coanda":         r"coanda\d",
+    "curtiss":        r"c(r\w+)?(urtis\w+)",
+    "dae":            r"dae\d{2}",
+    "davis":          r"davis[a-z_]*",
+    "daytona-wright": r"dayton\w*",
+    "sikorsky":       r"(dbln\d{3})?(gs\d)?|sc\d{4}(\D.*)?|ssca\d+",
+    "defiant":        r"def\w+",
+    "e-series":       r"e\d+",
+    "eh-series":      r"eh\d{4}",
+    "wright eiffel":  r"eiffel\d+",
+    "fage & collins": r"fg\d",
+    "wortmann fx":    r"fx\w+",
+    "giii":           r"giii\w",
+    "glenn martin":   r"(glenn\w+)?(gm\w+)",
+    "goe gottingen":  r"goe\w+",
+    "hq":             r"hq\d+\w+",
+    "ham-std":        r"hs\d+",
+    "ht":             r"ht\d\d",
+    "isa":            r"isa\d+",
+    "ist":            r"ist[a-z0-9-]+",
+    "nasa low-speed": r"ls\d+(mod)?",
+    "naca-m":         r"(naca)?m\d\d?",
+    "marske":         r"marske\d",
+    "mh":             r"mh\d+",
+    "nasa ms":        r"ms\d+",
+    "naca h-series":  r"n\dh\d+",
+    "nasa/naca":      r"n.*",
+    "naca 4-digit":   r"n(aca)?\d{4}\D+",
+    "naca 5-digit":   r"n[012345789]\d{4}\D+|naca[012345789]\d[a-z0-9-]\d{3}|naca[012345789]\d{4}",
+    "naca 6-series":  r"n6\d{4}\D+|naca6\d{1}[a-z0-9-]\d{3}|naca6\d{4}",
+    "naca 6-digit":   r"naca\d{3}\D\d{3}|naca\d{6}",
+    "nasa nlf":       r"nlf.+",
+    "nasa rc":        r"rc.*",
+    "nasa sc":        r"sc\d{5}",
+    "p-51d":          r"p51.*",
+    "rae":            r"rae\d+.*",
+    "raf":            r"raf\d+.*",
+    "rg":             r"rg.*",
+    "rhodes":         r"rhodes.*",
+    "s-4digit hpv":   r"s\d{4}.*",
+    "sd-4digit":      r"sd\d{4}",
+    "sg-4digit":      r"sg\d{4}",
+    "usa":            r"usa\w+",
+    "boeing vtol":    r"v\d{5}|vr.*",
+}
+
+# All families fused into one alternation. Alternatives are tried in order,
+# so the first family that matches wins.
+_family_names = tuple(filename_regexes)
+family_regex = re.compile("|".join(
+    f"(?P<f{i}>{pattern})" for i, pattern in enumerate(filename_regexes.values())
+))
+
+def classify_filename(filename):
+    """ Returns the name of the airfoil family that matches filename, or None """
+    match = family_regex.fullmatch(filename)
+    if match is None:
+        return None
+    return _family_names[int(match.lastgroup[1:])]
@@ -7,32 +7,75 @@ airfoil:
     "filename": filename (no extension)
     "extension": file extension
     "path": path to .dat file
-    "coordinates": list of [x,y] tuples defining the airfoil
-    "upper_planform": list of [x,y] tuples defining the top surface of the airfoil
-    "lower_planform": list of [x,y] tuples defining the lower surface of the airfoil
+    "family": airfoil family from _regexes.filename_regexes (None if unknown)
+    "coordinates": (N,2) array of [x,y] points defining the airfoil
+    "upper_planform": (N,2) array of [x,y] points defining the top surface of the airfoil
+    "lower_planform": (N,2) array of [x,y] points defining the lower surface of the airfoil
     "thickness": thickness of airfoil as a multiple of chord
+    "camber_line": (N,2) array of [x,y] points on the mean camber line
 }
 """
 
 import re
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 import sys
-from scipy import interpolate
-from data import Airfoil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from _kernels import find_sign_change_nb, surface_heights_nb, thickness_nb
+from _regexes import classify_filename
+
+# parsed airfoils keyed by (path, mtime), least recently used first
+_parse_cache = OrderedDict()
+_parse_cache_size = 8192
+
+def _cache_get(key):
+    airfoil = _parse_cache.get(key)
+    if airfoil is not None:
+        _parse_cache.move_to_end(key)
+        # the arrays are read-only, so a shallow copy keeps the cache intact
+        airfoil = dict(airfoil)
+    return airfoil
+
+def _cache_put(key, airfoil):
+    if airfoil is None:
+        return
+    for value in airfoil.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    _parse_cache[key] = airfoil
+    if len(_parse_cache) > _parse_cache_size:
+        _parse_cache.popitem(last=False)
 
 def parse_dir(directory):
-    files = os.listdir(directory)
-    airfoils = []
-    for file in files:
-        airfoil = parse_file(os.path.join(directory, file))
-        airfoils.append(airfoil)
-    return airfoils
+    """ Parses every airfoil file in a directory, in parallel across processes.
+    Files that have not changed since they were last parsed come from the cache. """
+    # only hand regular .dat files to the workers
+    with os.scandir(directory) as entries:
+        keys = [(entry.path, entry.stat().st_mtime_ns) for entry in entries
+                if entry.name.endswith('.dat') and entry.is_file()]
+    airfoils = {key: _cache_get(key) for key in keys}
+    missing = [key for key, airfoil in airfoils.items() if airfoil is None]
+    if missing:
+        with ProcessPoolExecutor() as executor:
+            parsed = executor.map(_parse_file, [path for path, _ in missing], chunksize=32)
+            for key, airfoil in zip(missing, parsed):
+                _cache_put(key, airfoil)
+                airfoils[key] = _cache_get(key)
+    return [airfoil for airfoil in airfoils.values() if airfoil is not None]
 
 
 def parse_file(filename):
-    """ Parses an airfoil data file into a list of coordinates """
+    """ Parses an airfoil data file into an airfoil dict.
+    The result is cached until the file's modification time changes. """
+    key = (filename, os.stat(filename).st_mtime_ns)
+    airfoil = _cache_get(key)
+    if airfoil is None:
+        _cache_put(key, _parse_file(filename))
+        airfoil = _cache_get(key)
+    return airfoil
+
+def _parse_file(filename):
     if os.path.splitext(filename)[1] != '.dat':
         raise FileNotFoundError(f"Bad extension: {os.path.splitext(filename)}")
     try:
@@ -55,145 +98,109 @@ def parse_file(filename):
         airfoil_dict["filename"] = filename
         airfoil_dict["extension"] = extension
         airfoil_dict["path"] = path
-        # ORM class
-        airfoil = Airfoil(**airfoil_dict)
-        return airfoil
+        airfoil_dict["family"] = classify_filename(filename)
+        # plain dict so it can be sent back from worker processes;
+        # the Airfoil ORM object is built on insert
+        return airfoil_dict
     else:
         return None
 
+number_regex = re.compile(r"[0-9.-]+")
+
 def _parse_coordinates(lines):
-    # Strip whitespace
-    lines = [line.strip() for line in lines if line.strip()]
-    # First line is the title
-    title = lines[0]
-    coords = []
-    number_regex = re.compile(r"[0-9.-]+")
-    for line in lines[1:]:
-        # Find x and y coordinates
-        numbers = number_regex.findall(line)
-        if len(numbers) != 2:
-            raise ValueError(f"Could not parse line (regex did not match): {line}")
-        x = float(numbers[0])
-        y = float(numbers[1])
-        coords.append([x, y])
+    # First non-blank line is the title
+    start = next((i for i, line in enumerate(lines) if line.strip()), None)
+    if start is None:
+        raise ValueError("No title line")
+    title = lines[start].strip()
+    try:
+        coords = np.loadtxt(lines[start+1:], dtype=np.float64, ndmin=2)
+    except ValueError:
+        # Irregular lines (e.g. stray tokens in the header): fall back to regex
+        coords = _parse_coordinates_regex(lines[start+1:])
+    if coords.shape[1] != 2:
+        raise ValueError(f"Expected 2 columns of coordinates, found {coords.shape[1]}")
     res = {"title": title, "coordinates": coords}
     # find upper and lower planforms
-    if [0,0] not in coords:
+    at_origin = np.flatnonzero(_point_mask(coords, (0,0)))
+    if at_origin.size:
+        origin_index = int(at_origin[0])
+    else:
         # find where dx reverses
         origin_index = find_sign_change(coords)
-    else:
-        origin_index = coords.index([0,0])
     upper_planform = coords[:origin_index+1]
     # Make sure trailing edge is included
-    if [1,0] not in upper_planform:
-        upper_planform.insert(0, (1,0))
+    if not _contains_point(upper_planform, (1,0)):
+        upper_planform = np.vstack(((1,0), upper_planform))
     lower_planform = coords[origin_index:]
-    if [1,0] not in lower_planform:
-        lower_planform.append([1,0])
+    if not _contains_point(lower_planform, (1,0)):
+        lower_planform = np.vstack((lower_planform, (1,0)))
     res["upper_planform"] = upper_planform
     res["lower_planform"] = lower_planform
-    # Find airfoil thickness
-    thickness = find_thickness(upper_planform, lower_planform)
-    res["thickness"] = thickness
+    # Find airfoil thickness and camber
+    y_upper, y_lower = _surface_heights(upper_planform, lower_planform)
+    res["thickness"] = float((y_upper - y_lower).max())
+    res["camber_line"] = np.column_stack((chord_grid, (y_upper + y_lower) / 2))
     return res
 
+def _parse_coordinates_regex(lines):
+    """ Slow path: pulls two numbers out of every non-blank line """
+    # at most one point per line; fill in place and trim blank lines off the end
+    coords = np.empty((len(lines), 2), dtype=np.float64)
+    k = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        # Find x and y coordinates
+        numbers = number_regex.findall(line)
+        if len(numbers) != 2:
+            raise ValueError(f"Could not parse line (regex did not match): {line}")
+        coords[k] = numbers
+        k += 1
+    return coords[:k]
+
+def _point_mask(coords, point):
+    """ Boolean mask of the rows of coords equal to point """
+    return (coords[:,0] == point[0]) & (coords[:,1] == point[1])
+
+def _contains_point(coords, point):
+    return bool(_point_mask(coords, point).any())
+
 def find_sign_change(coordinates):
-    for i in range(len(coordinates) - 2):
-        y1 = coordinates[i][0]
-        y2 = coordinates[i + 1][0]
-        y3 = coordinates[i + 2][0]
-        d1 = y2 - y1
-        d2 = y3 - y2
-        if np.sign(d1) == -1 and np.sign(d2) != np.sign(d1):
-            return i
-    raise ValueError("Sign change not found")
-
-def find_thickness(upper,lower):
-    get_ys = lambda coords: [y for [x,y] in coords]
-    get_xs = lambda coords: [x for [x,y] in coords]
-    # linear interpolation between values
-    f_upper = interpolate.interp1d(get_xs(upper), get_ys(upper))
-    f_lower = interpolate.interp1d(get_xs(lower), get_ys(lower))
-    f_thickness = lambda x: f_upper(x) - f_lower(x)
-    x = np.linspace(0,1,200)
-    y = f_thickness(x)
-    return max(y)
-
-
-filename_regexes = {
-    "ag (mark drela)":r"ag\d{2}(.*)?",
-    "althaus":        r"ah\d\d(.*)?",
-    "nasa ames":      r"ames\d\d",
-    "amsoil":         r"amsoil\d",
-    "arad: ":         r"arad\d{2}",
-    "ananda-selig":   r"as\d{4}",
-    "boeing":         r"b(7\d\d.)?(oe\d{3})?(ac.*)?",
-    "bambino":        r"e?bambino\d?",
-    "lockheed":       r"c(\d\w)?(\d{3}\w)?",
-    "clark":          r"clar[ky]\w+",
-    "coanda":         r"coanda\d",
-    "curtiss":        r"c(r\w+)?(urtis\w+)",
-    "dae":            r"dae\d{2}",
-    "davis":          r"davis[a-z_]*",
-    "daytona-wright": r"dayton\w*",
-    "sikorsky":       r"(dbln\d{3})?(gs\d)?|sc\d{4}(\D.*)?|ssca\d+",
-    "defiant":        r"def\w+",
-    "e-series":       r"e\d+",
-    "eh-series":      r"eh\d{4}",
-    "wright eiffel":  r"eiffel\d+",
-    "fage & collins": r"fg\d",
-    "wortmann fx":    r"fx\w+",
-    "giii":           r"giii\w",
-    "glenn martin":   r"(glenn\w+)?(gm\w+)",
-    "goe gottingen":  r"goe\w+",
-    "hq":             r"hq\d+\w+",
-    "ham-std":        r"hs\d+",
-    "ht":             r"ht\d\d",
-    "isa":            r"isa\d+",
-    "ist":            r"ist[a-z0-9-]+",
-    "nasa low-speed": r"ls\d+(mod)?",
-    "naca-m":         r"(naca)?m\d\d?",
-    "marske":         r"marske\d",
-    "mh":             r"mh\d+",
-    "nasa ms":        r"ms\d+",
-    "naca h-series":  r"n\dh\d+",
-    "nasa/naca":      r"n.*",
-    "naca 4-digit":   r"n(aca)?\d{4}\D+",
-    "naca 5-digit":   r"n[012345789]\d{4}\D+|naca[012345789]\d[a-z0-9-]\d{3}|naca[012345789]\d{4}",
-    "naca 6-series":  r"n6\d{4}\D+|naca6\d{1}[a-z0-9-]\d{3}|naca6\d{4}",
-    "naca 6-digit":   r"naca\d{3}\D\d{3}|naca\d{6}",
-    "nasa nlf":       r"nlf.+",
-    "nasa rc":        r"rc.*",
-    "nasa sc":        r"sc\d{5}",
-    "p-51d":          r"p51.*",
-    "rae":            r"rae\d+.*",
-    "raf":            r"raf\d+.*",
-    "rg":             r"rg.*",
-    "rhodes":         r"rhodes.*",
-    "s-4digit hpv":   r"s\d{4}.*",
-    "sd-4digit":      r"sd\d{4}",
-    "sg-4digit":      r"sg\d{4}",
-    "usa":            r"usa\w+",
-    "boeing vtol":    r"v\d{5}|vr.*",
-}
+    """ Returns the index i where x stops decreasing (x[i] > x[i+1] <= x[i+2]) """
+    index = find_sign_change_nb(coordinates[:,0])
+    if index < 0:
+        raise ValueError("Sign change not found")
+    return index
+
+# chordwise stations shared by the thickness and camber calculations
+chord_grid = np.linspace(0, 1, 1000)
+
+def _surface_heights(upper, lower):
+    """ Linearly interpolates both surfaces onto chord_grid """
+    return surface_heights_nb(upper, lower, chord_grid)
+
+def find_thickness(upper, lower):
+    return float(thickness_nb(upper, lower, chord_grid))
+
+def find_camber_line(upper, lower):
+    y_upper, y_lower = _surface_heights(upper, lower)
+    return np.column_stack((chord_grid, (y_upper + y_lower) / 2))
+
+
+def classify_airfoils(airfoils):
+    """ Maps each airfoil's filename to its family (None if unclassified) """
+    return {airfoil["filename"]: classify_filename(airfoil["filename"]) for airfoil in airfoils}
+
+def no_regex_pred(families):
+    """ Predicate for airfoils left unclassified in families (see classify_airfoils) """
+    return lambda airfoil: families.get(airfoil["filename"]) is None
 
 #Functions no longer needed
-#def find_re(name):
-#    return re.compile(filename_regexes[name])
-#
 #def regex_pred_fn(regex):
 #    return lambda airfoil: regex.fullmatch(airfoil["filename"])
 #
-#def no_regex_pred(regex_dict):
-#    def predicate(airfoil):
-#        res = True
-#        for regex in regex_dict.values():
-#            if regex.fullmatch(airfoil["filename"]):
-#                res = False
-#                break
-#        return res
-#    return predicate
-#
 #def matching_foils_fn(regex, airfoils):
 #    return [foil for foil in filter(regex_pred(regex), airfoils)]
 #
@@ -201,19 +208,14 @@ filename_regexes = {
 #    airfoils.sort(key=lambda airfoil: airfoil['filename'])
 
 def plot_coordinates(ax, coordinates, title=None, plot_chord=False):
-    coords = np.array(coordinates)
+    # no copy when the coordinates are already an array
+    coords = np.asarray(coordinates)
     ax.plot(coords[:,0], coords[:,1], color="black", label=title)
     if plot_chord:
         ax.plot([1,0], [0,0], color="red", linestyle='--')
-    ax.set_aspect("equal")
     # ax.legend()
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.spines['top'].set_visible(False)
-    ax.spines['bottom'].set_visible(False)
-    ax.spines['left'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.set_xlabel(title[:30])
+    ax.spines[:].set_visible(False)
+    ax.set(aspect="equal", xticks=[], yticks=[], xlabel=title[:30] if title else "")
 
 def make_subplots(axs, coordinates, titles, nrows, ncols):
     for i in range(nrows):
@@ -222,6 +224,24 @@ def make_subplots(axs, coordinates, titles, nrows, ncols):
             title = titles[j + ncols*i]
             plot_coordinates(axs[i,j], coords, title)
 
+def plot_grid(ax, coordinates, titles, nrows, ncols, col_pitch=1.2, row_pitch=0.6):
+    """ Draws airfoils in an nrows x ncols grid on a single axes.
+
+    All outlines go into one LineCollection, so a large grid is a single draw
+    call instead of one Axes and Line2D per airfoil. Meant for bulk export;
+    use make_subplots when each airfoil needs its own axes. """
+    from matplotlib.collections import LineCollection
+    segments = []
+    for k in range(min(nrows*ncols, len(coordinates))):
+        i, j = divmod(k, ncols)
+        x0, y0 = j*col_pitch, -i*row_pitch
+        segments.append(np.asarray(coordinates[k]) + (x0, y0))
+        ax.text(x0 + 0.5, y0 - row_pitch/3, titles[k][:30], ha="center", va="top", fontsize="small")
+    ax.add_collection(LineCollection(segments, colors="black"))
+    ax.autoscale_view()
+    ax.set_aspect("equal")
+    ax.set_axis_off()
+
 
 def main(argv = []):
     from data import insert_airfoil, insert_airfoils
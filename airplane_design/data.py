@@ -1,11 +1,12 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase, \
-Mapped, mapped_column
-import math
-from sqlalchemy.sql import select, insert
+from sqlalchemy import create_engine, event, inspect, text, bindparam, Index, LargeBinary
+from sqlalchemy.orm import Session, DeclarativeBase, \
+Mapped, mapped_column, undefer
+from functools import cache
+from sqlalchemy.sql import select, insert, update
 from sqlalchemy.dialects.sqlite import insert as upsert
 from typing import Optional, Dict
-import json
+import orjson
+import numpy as np
 
 # multiply by this number to change to consistent units MKS
 unit_table = {
@@ -17,11 +18,39 @@ unit_table = {
     "kg/m^3": 1,
 }
 
+def _dumps(array):
+    """ Serializes an (N,2) array of coordinates to raw float64 bytes """
+    if isinstance(array, bytes):
+        # already serialized (e.g. copied from another row), don't re-encode
+        return array
+    return np.ascontiguousarray(array, dtype=np.float64).tobytes()
+
+def _loads(blob):
+    """ Reads coordinates written by _dumps back as an (N,2) array (no copy) """
+    if isinstance(blob, str):
+        # rows written before the switch to binary columns hold json text
+        array = np.array(orjson.loads(blob), dtype=np.float64).reshape(-1, 2)
+        array.flags.writeable = False
+        return array
+    return np.frombuffer(blob, dtype=np.float64).reshape(-1, 2)
+
+_blob_columns = ("coordinates", "upper_planform", "lower_planform", "camber_line")
+
+def _airfoil_row(airfoil_data):
+    """ Converts a parsed airfoil dict into a row of the airfoils table """
+    row = dict(airfoil_data)
+    for column in _blob_columns:
+        row[column] = _dumps(row[column])
+    return row
+
 class Base(DeclarativeBase):
     pass
 
 class Material(Base):
     __tablename__ = "materials"
+    # the legacy materials table was created without the unique constraint's
+    # index; migrate_db adds this one
+    __table_args__ = (Index("ix_materials_name", "name"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(unique=True)
     youngs_mod: Mapped[Optional[float]]
@@ -60,76 +89,223 @@ class Airfoil(Base):
     filename: Mapped[str] = mapped_column(unique=True)
     path: Mapped[str]
     extension: Mapped[str]
-    coordinates: Mapped[str] # json
-    upper_planform: Mapped[str] # json
-    lower_planform: Mapped[str] # json
+    # see _regexes.py; deferred so databases from before migrate_db stay readable
+    family: Mapped[Optional[str]] = mapped_column(index=True, deferred=True)
+    coordinates: Mapped[bytes] = mapped_column(LargeBinary) # float64 (N,2)
+    upper_planform: Mapped[bytes] = mapped_column(LargeBinary) # float64 (N,2)
+    lower_planform: Mapped[bytes] = mapped_column(LargeBinary) # float64 (N,2)
     thickness: Mapped[float]
-    camber_line: Mapped[str] # json
+    camber_line: Mapped[bytes] = mapped_column(LargeBinary) # float64 (N,2)
 
     def __init__(self, coordinates, upper_planform, lower_planform, camber_line, *args, **kwargs):
-        self.coordinates = json.dumps(coordinates)
-        self.upper_planform = json.dumps(coordinates)
-        self.lower_planform = json.dumps(coordinates)
-        self.camber_line = json.dumps(camber_line)
+        # coordinates arrive as numpy arrays; serialize them only here
+        self.coordinates = _dumps(coordinates)
+        self.upper_planform = _dumps(upper_planform)
+        self.lower_planform = _dumps(lower_planform)
+        self.camber_line = _dumps(camber_line)
         super(Airfoil, self).__init__(*args, **kwargs)
 
+    def _decoded(self, column):
+        """ column's stored coordinates as a (read-only) array, decoded once per
+        stored value: the cache entry is only reused while it was decoded from
+        the very object the attribute holds now """
+        blob = getattr(self, column)
+        # not a mapped attribute, so the ORM neither loads nor persists it
+        cache = self.__dict__.setdefault("_decoded_arrays", {})
+        cached = cache.get(column)
+        if cached is None or cached[0] is not blob:
+            cached = cache[column] = (blob, _loads(blob))
+        return cached[1]
+
     def deserialize(self):
         """
         Deserializes the airfoil information and returns a dict
         """
+        arrays = {column: self._decoded(column) for column in _blob_columns}
         airfoil_dict = {
             "title": self.title,
             "filename": self.filename,
             "extension": self.extension,
             "path": self.path,
-            "coordinates": json.loads(self.coordinates),
-            "upper_planform": json.loads(self.upper_planform),
-            "lower_planform": json.loads(self.lower_planform),
+            # loaded with the row when the query undefers it (see _airfoil_query);
+            # never triggers a SELECT of its own
+            "family": inspect(self).dict.get("family"),
+            "coordinates": arrays["coordinates"],
+            "upper_planform": arrays["upper_planform"],
+            "lower_planform": arrays["lower_planform"],
             "thickness": self.thickness,
-            "camber_line": json.loads(self.camber_line)
+            "camber_line": arrays["camber_line"]
         }
         return airfoil_dict
 
 # problems with relative path
-# engine = create_engine('sqlite:///../data/design.db')
-engine = create_engine('sqlite:///data/design.db')
-Session = sessionmaker(bind=engine)
-session = Session()
+# database_url = 'sqlite:///../data/design.db'
+database_url = 'sqlite:///data/design.db'
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # per-connection settings only; nothing here changes the database file
+    cursor = dbapi_connection.cursor()
+    # in WAL mode (see migrate_db) commits append to the log, so NORMAL sync is safe
+    cursor.execute("PRAGMA journal_mode")
+    if cursor.fetchone()[0] == "wal":
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    # 64 MiB page cache, temporary tables and indices in memory
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+@cache
+def get_engine():
+    """ Creates the database engine on first use, so importing data is cheap.
+    Never changes the schema; see migrate_db. """
+    # pooled connections may be reused from the GUI's worker threads
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+def migrate_db(engine=None):
+    """
+    Brings a database created by an older version up to date: adds and fills
+    airfoils.family, creates missing indices and switches the file to WAL mode.
+    Run explicitly (`python data.py`) before ingesting airfoils.
+    """
+    if engine is None:
+        engine = get_engine()
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        if inspector.has_table("airfoils"):
+            _add_family_column(connection, inspector)
+        if inspector.has_table("materials"):
+            # the legacy materials table was created without an index on name
+            for index in Material.__table__.indexes:
+                index.create(connection, checkfirst=True)
+    with engine.connect() as connection:
+        # persistent: stored in the database file
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    _has_family_column.cache_clear()
+
+def _add_family_column(connection, inspector):
+    """ Adds and fills airfoils.family in databases created before it existed """
+    from _regexes import classify_filename
+    if "family" in [column["name"] for column in inspector.get_columns("airfoils")]:
+        return
+    connection.execute(text("ALTER TABLE airfoils ADD COLUMN family VARCHAR"))
+    for index in Airfoil.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    rows = connection.execute(select(Airfoil.id, Airfoil.filename)).all()
+    if rows:
+        connection.execute(
+            update(Airfoil.__table__).where(Airfoil.id == bindparam("row_id")),
+            [{"row_id": row_id, "family": classify_filename(filename)} for row_id, filename in rows])
+
+@cache
+def _has_family_column():
+    """ False for unmigrated databases, whose airfoils can still be read """
+    with get_engine().connect() as connection:
+        inspector = inspect(connection)
+        return inspector.has_table("airfoils") and \
+            "family" in [column["name"] for column in inspector.get_columns("airfoils")]
+
+@cache
+def get_session():
+    """ Returns the session shared by the module-level helpers """
+    return Session(get_engine())
 
 def get_materials_like(name):
-    materials = session.scalars(select(Material)\
+    materials = get_session().scalars(select(Material)\
                                 .where(Material.name.like(name + '%'))).all()
     return materials
 
-def insert_airfoil(airfoil_data: Dict, session=session, commit=True):
+# one statement (and one cached compilation) for any number of names
+_materials_stmt = select(Material).where(Material.name.in_(bindparam("names", expanding=True)))
+
+def get_materials(names):
+    """ Fetches materials by exact name in one query, as a {name: Material} dict """
+    materials = get_session().scalars(_materials_stmt, {"names": list(names)})
+    return {material.name: material for material in materials}
+
+# materials by name; the materials table is read-only at runtime, so repeat
+# lookups (every GUI update) skip the query
+_material_cache = {}
+
+def get_material(name):
+    """ Fetches one material by exact name, cached """
+    if name not in _material_cache:
+        cache_materials([name])
+    return _material_cache[name]
+
+def cache_materials(names):
+    """ Fetches the uncached materials among names in one query """
+    missing = [name for name in names if name not in _material_cache]
+    if missing:
+        _material_cache.update(get_materials(missing))
+
+def insert_airfoil(airfoil_data: Dict, session=None, commit=True):
     """
     Inserts an airfoil to the database
     """
+    if session is None:
+        session = get_session()
     airfoil = Airfoil(**airfoil_data)
     session.add(airfoil)
     if commit:
         session.commit()
 
-def insert_airfoils(airfoil_data, session=session):
+def insert_airfoils(airfoil_data, session=None):
     """
-    Inserts a list of airfoils
+    Inserts a list of airfoils in a single transaction
     """
-    for airfoil in airfoils:
-        insert_airfoil(airfoil, session=session, commit=False)
-        session.commit()
+    if session is None:
+        session = get_session()
+    # Core insert: one executemany, no per-row ORM objects
+    rows = [_airfoil_row(airfoil) for airfoil in airfoil_data]
+    if not rows:
+        return
+    try:
+        session.execute(insert(Airfoil.__table__), rows)
+    except Exception:
+        # all or nothing, and leave the shared session usable
+        session.rollback()
+        raise
+    session.commit()
+
 
+def _airfoil_query():
+    """ select(Airfoil), fetching the deferred family column in the same query
+    when the database has it """
+    stmt = select(Airfoil)
+    if _has_family_column():
+        stmt = stmt.options(undefer(Airfoil.family))
+    return stmt
+
+def get_airfoils_by_family(family):
+    """ Airfoils in a family from _regexes.filename_regexes, via the family index
+    (needs a database updated by migrate_db) """
+    matches = get_session().scalars(_airfoil_query().where(Airfoil.family == family))
+    return matches.all()
 
 def get_airfoils_by_re(re_pattern):
-    matches = session.scalars(select(Airfoil).where(Airfoil.filename.regexp_match(re_pattern)))
+    """ Ad-hoc filename search; scans every row, so prefer get_airfoils_by_family """
+    matches = get_session().scalars(_airfoil_query().where(Airfoil.filename.regexp_match(re_pattern)))
     return matches.all()
 
+def iter_airfoils_by_re(re_pattern, batch_size=256):
+    """ Streams (filename, coordinates) for a filename search as plain rows,
+    without building Airfoil objects. Use get_airfoils_by_re for full records. """
+    table = Airfoil.__table__
+    stmt = select(table.c.filename, table.c.coordinates)\
+        .where(table.c.filename.regexp_match(re_pattern))\
+        .execution_options(yield_per=batch_size)
+    for filename, coordinates in get_session().execute(stmt):
+        yield filename, _loads(coordinates)
+
 
 if __name__ == "__main__":
     from airfoil import parse_dir
-    engine = create_engine('sqlite:///data/design.db')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-#    with Session() as session:
+    engine = get_engine()
+    migrate_db(engine)
+    session = get_session()
+#    with Session(engine) as session:
 #        Base.metadata.create_all(engine)
 #        airfoils = parse_dir("/home/jasper/PARA/3_Resources/06_Airplanes/Airfoil_Coordinates")
 #        for airfoil in airfoils:
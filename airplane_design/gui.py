@@ -21,21 +21,64 @@ class StructuresGraph(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super(StructuresGraph, self).__init__(parent)
         self.resize(800, 600)
-        self.figure = Figure()
+        # laid out as part of each full draw (resize, rescale), never per update
+        self.figure = Figure(constrained_layout=True)
         self.canvas = FigureCanvas(self.figure)
         # add 2x2 grid of subplots
         self.axs = self.figure.subplots(2,2)
         self.setLayout(QtWidgets.QVBoxLayout())
         self.layout().addWidget(self.canvas)
-    
+        # one persistent (animated) line per chart, blitted over a cached
+        # background of the axes, ticks and labels
+        self.lines = structures.init_charts(self.axs, animated=True)
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        # full redraws (first update, rescale, resize) refresh the background
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in self.lines.values():
+            line.axes.draw_artist(line)
+
+    @staticmethod
+    def _rescale(ax, line):
+        """ Autoscales ax if the line has left its limits or shrunk well inside them """
+        changed = False
+        for data, (lo, hi) in zip(line.get_data(), (ax.get_xlim(), ax.get_ylim())):
+            dmin, dmax = data.min(), data.max()
+            if dmin < lo or dmax > hi:
+                changed = True
+            # constant data (e.g. zero weight) has no span to shrink; as long as
+            # it is inside the limits, keep them and keep blitting
+            elif dmax > dmin and dmax - dmin < 0.5*(hi - lo):
+                changed = True
+        if changed:
+            ax.relim()
+            ax.autoscale_view()
+        return changed
+
+    def clear(self):
+        for line in self.lines.values():
+            line.set_data([], [])
+        self.canvas.draw()
+
     def update(self, system):
         # plot outputs
-        for axs_row in self.axs:
-            for ax in axs_row:
-                ax.clear()
-        structures.make_all_charts(self.axs, system)
-        self.figure.tight_layout()
-        self.canvas.draw()
+        rescaled = False
+        for position, x, data in structures.chart_data(system):
+            line = self.lines[position]
+            line.set_data(x, data)
+            # structures.plot_data would rescale every update; only do so when needed
+            rescaled |= self._rescale(line.axes, line)
+        if self.background is None or rescaled:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_lines()
+            self.canvas.blit(self.figure.bbox)
 
 class StruTextOutput(QtWidgets.QTextEdit):
     def __init__(self, parent=None):
@@ -49,6 +92,51 @@ Maximum stress: {sysinfo['max_stress'] / 1e6:0.2f} MPa
 Mass: {system['beam'].mass * 1e3:0.2f} g"""
         self.setText(string)
 
+class SystemSolver(QtCore.QObject):
+    """ Runs structures.get_system on the global thread pool, one solve at a time.
+    Requests that arrive mid-solve are coalesced into one follow-up solve. """
+    solved = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+    _finished = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super(SystemSolver, self).__init__(parent)
+        # two sets of result arrays: one being solved into, one on screen
+        self._buffers = [structures.make_buffers(), structures.make_buffers()]
+        self._busy = False
+        self._pending = None
+        self._finished.connect(self._on_finished)
+
+    def request(self, args):
+        if self._busy:
+            self._pending = args
+        else:
+            self._start(args)
+
+    def _start(self, args):
+        self._busy = True
+        buffers = self._buffers[0]
+        self._buffers.reverse()
+        QtCore.QThreadPool.globalInstance().start(lambda: self._run(args, buffers))
+
+    def _run(self, args, buffers):
+        # worker thread: _finished is delivered back on the GUI thread
+        try:
+            result = structures.get_system(*args, out=buffers)
+        except Exception as e:
+            result = e
+        self._finished.emit(result)
+
+    def _on_finished(self, result):
+        self._busy = False
+        if isinstance(result, Exception):
+            self.failed.emit(f"{type(result).__name__}: {result}")
+        else:
+            self.solved.emit(result)
+        if self._pending is not None:
+            args, self._pending = self._pending, None
+            self._start(args)
+
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
@@ -60,6 +148,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.create_layout()
         self.create_connections()
         self.update()
+        # one query up front; solves on the worker threads then never touch the db
+        structures.preload_materials()
         self.update_plot()
 
     def create_widgets(self):
@@ -82,6 +172,11 @@ class MainWindow(QtWidgets.QMainWindow):
         self.gforce_input = QtWidgets.QLineEdit('6')
         self.plot = StructuresGraph()
         self.text_output = StruTextOutput()
+        self.solver = SystemSolver(self)
+        # collapse bursts of edits into a single solve
+        self.debounce = QtCore.QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(100)
 
     def create_layout(self):
         self.layout.addWidget(self.materials_label, 0, 0)
@@ -103,28 +198,43 @@ class MainWindow(QtWidgets.QMainWindow):
         self.layout.addWidget(self.text_output, 8, 0, 3, 4)
 
     def create_connections(self):
-        # self.materials_dropdown.currentIndexChanged.connect(self.update_plot)   
-        # self.beam_dropdown.currentIndexChanged.connect(self.update_plot)
-        # self.spar_outer_input.textChanged.connect(self.update_plot)
-        # self.spar_inner_input.textChanged.connect(self.update_plot)
-        # self.wing_span_input.textChanged.connect(self.update_plot)
+        restart = lambda *args: self.debounce.start()
+        self.materials_dropdown.currentIndexChanged.connect(restart)
+        self.beam_dropdown.currentIndexChanged.connect(restart)
+        for line_edit in (self.spar_outer_input, self.spar_inner_input, self.wing_span_input,
+                          self.weight_input, self.gforce_input):
+            line_edit.textChanged.connect(restart)
+        self.debounce.timeout.connect(self.update_plot)
         self.update_button.clicked.connect(self.update_plot)
-        
+        self.solver.solved.connect(self.show_system)
+        self.solver.failed.connect(self.show_error)
+
     def update_plot(self):
         # get inputs
         material_name = structures.mat_dict[self.materials_dropdown.currentText()]
-        spar_outer = float(self.spar_outer_input.text())*1e-3
-        spar_inner = float(self.spar_inner_input.text())*1e-3
-        wing_span = float(self.wing_span_input.text())
-        weight = float(self.weight_input.text())
-        gforce = float(self.gforce_input.text())
+        try:
+            spar_outer = float(self.spar_outer_input.text())*1e-3
+            spar_inner = float(self.spar_inner_input.text())*1e-3
+            wing_span = float(self.wing_span_input.text())
+            weight = float(self.weight_input.text())
+            gforce = float(self.gforce_input.text())
+        except ValueError:
+            # half-typed number; wait for the next edit
+            return
         beamtype = structures.beam_dict[self.beam_dropdown.currentText()]
         dimensions = {"outer": spar_outer, "inner": spar_inner, "length": wing_span}
-        # calculate outputs
-        system = structures.get_system(material_name, dimensions, weight, gforce, beamtype)
+        # calculate outputs off the GUI thread
+        self.solver.request((material_name, dimensions, weight, gforce, beamtype))
+
+    def show_system(self, system):
         self.plot.update(system)
         self.text_output.update(system)
 
+    def show_error(self, message):
+        # don't leave the previous design's results up as if they were current
+        self.plot.clear()
+        self.text_output.setText(f"Could not solve this design:\n{message}")
+
 if __name__=="__main__":
     app = QtWidgets.QApplication([])
     window = MainWindow()
@@ -5,20 +5,25 @@ Usage: `python structures.py` will output an example graph
 """
 
 import math
+from functools import lru_cache
 import numpy as np
-from scipy import integrate
-from data import get_materials_like, Material
-import matplotlib.pyplot as plt
+from data import cache_materials, get_material, get_materials_like, Material
+from _kernels import cumtrapz_nb, solve_beam_nb, solve_beams_nb
 
+# display name: material name in the database
 mat_dict = {
     "cfrp (lower bound)": "cfrp (lower)",
     "cfrp (upper bound)": "cfrp (upper)",
     "gfrp (lower bound)": "gfrp (lower)",
     "gfrp (upper bound)": "gfrp (upper)",
-    "wood (// to grain)": "wood (parallel)",
-    "wood (-| to grain)": "wood (perpendicular)"
+    "wood (// to grain)": "wood (parallel to grain) (upper)",
+    "wood (-| to grain)": "wood (perpendicular to grain) (upper)"
 }
 
+def preload_materials():
+    """ Fetches every mat_dict material in one query, so get_system doesn't have to """
+    cache_materials(mat_dict.values())
+
 # def get_modulus(material):
     # material = get_materials_like(mat_dict[material])[0]
     # return material.youngs_mod
@@ -26,6 +31,17 @@ mat_dict = {
 gravity = 9.81
 
 
+@lru_cache(maxsize=64)
+def _grid(zmin, zmax, nzvals):
+    """ zvals, the unit elliptic lift distribution over them (scaled per load
+    by find_loading) and its sum. Shared, read-only, by every beam with the same grid. """
+    zvals = np.linspace(zmin, zmax, nzvals)
+    elliptic_shape = np.sqrt(np.maximum(1 - (2*zvals/(zmax - zmin))**2, 0))
+    zvals.flags.writeable = False
+    elliptic_shape.flags.writeable = False
+    return zvals, elliptic_shape, elliptic_shape.sum()
+
+
 class Beam():
     """ Superclass for simple beams """
     material: Material
@@ -38,14 +54,31 @@ class Beam():
         self.length = dimensions['length']
         self.zmax = self.length/2
         self.zmin = -self.length/2
+        self._find_geometry()
+        self.mass = self.volume * self.material.get_density() if self.material.get_density() else 0
+        self.dz = (self.zmax - self.zmin)/(self.nzvals - 1)
+        self.section_modulus = self.I_x / (self.max_height()/2)
+    
+    # grid quantities are only built when first needed (solving or plotting), so
+    # beams used just for their section properties never allocate them
+    @property
+    def zvals(self):
+        return _grid(self.zmin, self.zmax, self.nzvals)[0]
+    @property
+    def elliptic_shape(self):
+        return _grid(self.zmin, self.zmax, self.nzvals)[1]
+    @property
+    def elliptic_shape_sum(self):
+        return _grid(self.zmin, self.zmax, self.nzvals)[2]
+
+    def _find_geometry(self):
+        """ Sets I_x, I_y, J_z and volume. Subclasses whose properties share
+        subexpressions can override this to compute them together. """
         self.I_x = self._find_I_x()
         self.I_y = self._find_I_y()
         self.J_z = self._find_J_z()
         self.volume = self._find_volume()
-        self.mass = self.volume * self.material.get_density() if self.material.get_density() else 0
-        self.zvals = np.linspace(self.zmin, self.zmax, self.nzvals)
-        self.section_modulus = self.I_x / (self.max_height()/2)
-    
+
     def _find_I_x(self):
         raise NotImplementedError
     def _find_I_y(self):
@@ -58,27 +91,77 @@ class Beam():
         return self.dimensions['outer']
     
 
+def find_I_hollow_cyl(outer, inner):
+    """ Second moment of area of a hollow circular section from its diameters.
+    Works elementwise on arrays of diameters as well as on scalars. """
+    do2 = outer * outer
+    di2 = inner * inner
+    # d_o^4 - d_i^4 = (d_o^2 + d_i^2)(d_o^2 - d_i^2)
+    return math.pi/64 * (do2 + di2) * (do2 - di2)
+
+def find_J_hollow_cyl(outer, inner):
+    """ Polar moment of area of a hollow circular section from its diameters """
+    return 2 * find_I_hollow_cyl(outer, inner)
+
 class HollowCyl(Beam):
-    """ Hollow cylinder beam """
+    """ Hollow cylinder beam. Section properties (but not the solvers) also
+    accept arrays of diameters, for sweeps over candidate sections. """
 
-    def _find_I_x(self):
-        return math.pi/64 * (self.dimensions['outer']**4 - self.dimensions['inner']**4)
-    _find_I_y = _find_I_x
-    def _find_J_z(self):
-        return math.pi/32 * (self.dimensions['outer']**4 - self.dimensions['inner']**4)
-    def _find_volume(self):
-        return math.pi/4 * (self.dimensions['outer']**2 - self.dimensions['inner']**2) * self.length
+    def _find_geometry(self):
+        outer, inner = self.dimensions['outer'], self.dimensions['inner']
+        self.I_x = self.I_y = find_I_hollow_cyl(outer, inner)
+        self.J_z = 2 * self.I_x
+        self.volume = math.pi/4 * (outer * outer - inner * inner) * self.length
 
 class HollowSquare(Beam):
     """ Hollow square beam """
     def _find_I_x(self):
         return 1/12 * (self.dimensions['outer']**4 - self.dimensions['inner']**4)
-    _find_I_y = _find_I_x
+    def _find_I_y(self):
+        # symmetric section
+        return self.I_x
     def _find_J_z(self):
         return self.I_x + self.I_y
     def _find_volume(self):
         return (self.outer_width**2 - self.inner_width**2) * self.length
 
+class BeamBatch():
+    """ Hollow cylinder beams of one material, stored as arrays of their properties
+    (one entry per beam) so a sweep can be solved with solve_system_batch in a
+    few vectorized passes. Works with find_loading and the find_* solvers, which
+    then return (nzvals, nbeams) arrays with one column per beam. """
+    material: Material
+
+    def __init__(self, material, outer, inner, length, nzvals=1000):
+        self.material = material
+        # scalars are shared by every beam in the batch
+        self.outer, self.inner, self.length = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (outer, inner, length)))
+        self.nzvals = nzvals
+        self.I_x = self.I_y = find_I_hollow_cyl(self.outer, self.inner)
+        self.J_z = 2 * self.I_x
+        self.volume = math.pi/4 * (self.outer**2 - self.inner**2) * self.length
+        self.mass = self.volume * self.material.get_density() if self.material.get_density() else 0
+        # every beam shares the same grid relative to its length
+        unit_z = np.linspace(-0.5, 0.5, nzvals)[:, np.newaxis]
+        self.zvals = unit_z * self.length
+        self.dz = self.length/(nzvals - 1)
+        self.elliptic_shape = np.sqrt(np.maximum(1 - (2*unit_z)**2, 0))
+        self.elliptic_shape_sum = self.elliptic_shape.sum()
+        self.section_modulus = self.I_x / (self.outer/2)
+
+    @classmethod
+    def from_beams(cls, beams):
+        """ Gathers HollowCyl beams sharing a material and grid size into a batch """
+        material, nzvals = beams[0].material, beams[0].nzvals
+        if any(beam.material is not material or beam.nzvals != nzvals for beam in beams):
+            raise ValueError("beams in a batch must share a material and nzvals")
+        return cls(material,
+                   [beam.dimensions['outer'] for beam in beams],
+                   [beam.dimensions['inner'] for beam in beams],
+                   [beam.length for beam in beams],
+                   nzvals=nzvals)
+
 beam_dict = {
     "Hollow Cylinder": HollowCyl,
     "Hollow Square": HollowSquare
@@ -89,7 +172,7 @@ def get_elliptic_lift_fn(beam, lift_tot):
     corresponding to an elliptic lift distribution over y. """
     ellipse = lambda y: np.sqrt(1 - (2*y)**2) # from -1/2 to 1/2
     # find lift at midpoint (0.785 = area under ellipse(y) )
-    lift_0 = lift_tot/(beam.length * 0.785398163397448)
+    lift_0 = lift_tot/(beam.length * math.pi/4)
     scaled_ellipse = lambda y: lift_0 * ellipse(y/beam.length)
     return scaled_ellipse
 
@@ -97,58 +180,99 @@ def find_weight(mass, gforce):
     """ Find the effective weight of a mass accelerating at `gforce` times the acceleration due to gravity"""
     return mass * gforce * gravity
 
-def find_loading(W, beam):
+def find_loading(W, beam, out=None):
     """ Given a centered array of y-values, returns the loading distribution over the wing """
-    # model elliptic lift over the wing
-    lift = get_elliptic_lift_fn(beam,W)
-    loading = lift(beam.zvals)
-    # model airplane weight as a delta function at y=0
-    loading[len(loading)//2] -= np.sum(loading)
+    # model elliptic lift over the wing (pi/4 = area under the unit ellipse)
+    lift_0 = W/(beam.length * math.pi/4)
+    loading = np.multiply(beam.elliptic_shape, lift_0, out=out)
+    # model airplane weight as a delta function at y=0, balancing the total lift
+    loading[beam.nzvals//2] -= lift_0 * beam.elliptic_shape_sum
     return loading
 
-def integrate_arr(array, beam):
+def cumtrapz_uniform(array, dz, out=None):
+    """ Cumulative trapezoidal integral of samples spaced dz apart, starting
+    from 0 (same shape as array). Integrates along the first axis, so 2D arrays
+    are integrated column by column (dz may then hold one spacing per column).
+    Written into `out` when given. """
+    if out is None:
+        out = np.empty(np.shape(array))
+    out[0] = 0.0
+    np.add(array[:-1], array[1:], out=out[1:])
+    out *= 0.5*dz
+    return np.cumsum(out, axis=0, out=out)
+
+def _check_shapes(shape, **arrays):
+    """ Raises ValueError unless every array has the given (non-empty) shape """
+    if not shape or 0 in shape:
+        raise ValueError(f"expected a non-empty array, got shape {shape}")
+    for name, array in arrays.items():
+        if np.shape(array) != shape:
+            raise ValueError(f"{name} has shape {np.shape(array)}, expected {shape}")
+
+def cumtrapz(array, x, out=None):
+    """ Cumulative trapezoidal integral of array over a non-uniform grid x,
+    starting from 0 (same length as array). Written into `out` when given. """
+    array = np.asarray(array, dtype=float)
+    x = np.asarray(x, dtype=float)
+    if out is None:
+        out = np.empty(len(array))
+    # the compiled kernel doesn't bounds-check
+    _check_shapes(array.shape, x=x, out=out)
+    return cumtrapz_nb(array, x, out)
+
+def integrate_arr(array, beam, out=None):
     """ Integrates an array of values over the wing """
-    return integrate.cumulative_trapezoid(array, beam.zvals[:len(array)])
+    return cumtrapz_uniform(array, beam.dz, out=out)
 
 
-def find_shear(loading, beam):
+def find_shear(loading, beam, out=None):
     """ Finds shear given loading conditions """
-    shear = integrate_arr(loading, beam)
+    shear = integrate_arr(loading, beam, out=out)
     # free end boundary condition
     shear -= shear[0]
     return shear
 
-def find_moment(shear, beam):
+def find_moment(shear, beam, out=None):
     """ Finds moment acting on the wing given shear """
-    moment = integrate_arr(shear, beam)
+    moment = integrate_arr(shear, beam, out=out)
     # free end boundary condition
     moment -= moment[0]
     return moment
 
-def find_angle(moment, beam):
+def find_angle(moment, beam, out=None):
     """ Finds the y-relative angle of the wing given moment """
-    # angle of beam at given moment
-    theta = integrate_arr(moment, beam)
-    theta /= (beam.I_x * beam.material.get_youngs_mod())
+    # angle of beam at given moment; 1/EI is folded into the integration's
+    # step scaling rather than taking another pass over the array
+    EI = beam.I_x * beam.material.get_youngs_mod()
+    theta = cumtrapz_uniform(moment, beam.dz / EI, out=out)
     # fixed center boundary condition
     theta -= theta[len(theta)//2]
     return theta
 
-def find_displacement(theta, beam):
+def find_displacement(theta, beam, out=None):
     """ Finds the vertical displacement of the wing given angle """
     # vertical displacement
-    disp = integrate_arr(theta, beam)
+    disp = integrate_arr(theta, beam, out=out)
     # fixed center boundary condition
     disp -= disp[len(disp)//2]
     return disp
 
-def solve_system(loading, beam):
-    """ Solves the system of equations for shear, moment, angle, and displacement """
-    shear = find_shear(loading, beam)
-    moment = find_moment(shear, beam)
-    angle = find_angle(moment, beam)
-    disp = find_displacement(angle, beam)
-    max_stress = max(moment) / beam.section_modulus
+def make_buffers(nzvals=1000):
+    """ Preallocated output arrays for get_system/solve_system on an nzvals grid """
+    return {key: np.empty(nzvals) for key in ("loading", "shear", "moment", "angle", "displacement")}
+
+def solve_system(loading, beam, out=None):
+    """ Solves the system of equations for shear, moment, angle, and displacement.
+    Results are written into the arrays of `out` (see make_buffers) when given. """
+    loading = np.ascontiguousarray(loading, dtype=float)
+    out = out or make_buffers(len(loading))
+    shear, moment, angle, disp = (out[key] for key in ("shear", "moment", "angle", "displacement"))
+    # the compiled kernel doesn't bounds-check
+    _check_shapes(loading.shape, shear=shear, moment=moment, angle=angle, displacement=disp)
+    # find_shear -> find_moment -> find_angle -> find_displacement in one compiled pass
+    max_moment = solve_beam_nb(loading, beam.dz, beam.I_x * beam.material.get_youngs_mod(),
+                               shear, moment, angle, disp)
+    max_stress = max_moment / beam.section_modulus
     return {
         "beam": beam,
         "loading": loading,
@@ -159,46 +283,96 @@ def solve_system(loading, beam):
         "max_stress": max_stress
     }
 
+def solve_system_batch(loading, batch, out=None):
+    """ solve_system for every beam of a BeamBatch at once, in parallel. loading
+    (see find_loading) and the results have one column per beam. """
+    loading = np.ascontiguousarray(loading, dtype=float)
+    out = out or {key: np.empty_like(loading) for key in ("shear", "moment", "angle", "displacement")}
+    shear, moment, angle, disp = (out[key] for key in ("shear", "moment", "angle", "displacement"))
+    dz = np.ascontiguousarray(batch.dz, dtype=float)
+    EI = np.ascontiguousarray(batch.I_x * batch.material.get_youngs_mod(), dtype=float)
+    # the compiled kernel doesn't bounds-check
+    if loading.ndim != 2:
+        raise ValueError(f"loading must have one column per beam, got shape {loading.shape}")
+    _check_shapes(loading.shape, shear=shear, moment=moment, angle=angle, displacement=disp)
+    _check_shapes(loading.shape[1:], dz=dz, EI=EI)
+    max_moment = np.empty(loading.shape[1])
+    solve_beams_nb(loading, dz, EI, shear, moment, angle, disp, max_moment)
+    return {
+        "beam": batch,
+        "loading": loading,
+        "shear": shear,
+        "moment": moment,
+        "angle": angle,
+        "displacement": disp,
+        "max_stress": max_moment / batch.section_modulus
+    }
+
 def get_system_info(system):
-    max_moment = max(system['moment'])
-    max_displacement = max(system['displacement'])
-    max_stress = max_moment / system['beam'].section_modulus
     return {
-        "max_moment": max_moment,
-        "max_displacement": max_displacement,
-        "max_stress": max_stress
+        "max_moment": system['moment'].max(),
+        "max_displacement": system['displacement'].max(),
+        "max_stress": system['max_stress']
     }
 
 
-def plot_data(ax, y, data, color="black", xlabel="y distance", ylabel=""):
-    ax.plot(y, data, color=color)
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
+# axes position: y label of each chart
+chart_labels = {
+    (0,0): "shear (N)",
+    (1,0): "moment (N.m)",
+    (0,1): "angle (deg)",
+    (1,1): "displacement (mm)",
+}
+
+def plot_data(line, y, data):
+    line.set_data(y, data)
+    line.axes.relim()
+    line.axes.autoscale_view()
+
+def init_charts(axs, color="black", xlabel="y distance", **kwargs):
+    """ Creates one (empty) line per chart on a 2x2 grid of axes and labels the axes.
+    Returns the lines by axes position, for make_all_charts. """
+    lines = {}
+    for position, ylabel in chart_labels.items():
+        ax = axs[position]
+        lines[position] = ax.plot([], [], color=color, **kwargs)[0]
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+    return lines
 
-def make_all_charts(axs, system):
-    """ Makes all charts for a given wing """
+def chart_data(system):
+    """ (axes position, x, y) for each chart of a solved system """
     y = system['beam'].zvals
-    plot_data(axs[0,0], y[:-1], system['shear'], ylabel="shear (N)")
-    plot_data(axs[1,0], y[:-2], system['moment'], ylabel="moment (N.m)")
-    plot_data(axs[0,1], y[:-3], system['angle'] * 180 / math.pi, ylabel="angle (deg)")
-    plot_data(axs[1,1], y[:-4], system['displacement'] * 1e3, ylabel="displacement (mm)")
+    return [
+        ((0,0), y, system['shear']),
+        ((1,0), y, system['moment']),
+        ((0,1), y, np.rad2deg(system['angle'])),
+        ((1,1), y, system['displacement'] * 1e3),
+    ]
+
+def make_all_charts(lines, system):
+    """ Updates the lines from init_charts with a given wing """
+    for position, x, data in chart_data(system):
+        plot_data(lines[position], x, data)
     # axs[0,0].axis([min(y)-0.5, max(y)+0.5, -1, max(loading)])
 
-def get_system(material_name, dimensions, W, gforce, beamtype):
-    material = get_materials_like(material_name)[0]
+def get_system(material_name, dimensions, W, gforce, beamtype, out=None):
+    material = get_material(material_name)
     weight = find_weight(W, gforce)
     beam = beamtype(material, dimensions)
-    loading = find_loading(weight, beam)
-    system = solve_system(loading, beam)
+    loading = find_loading(weight, beam, out=out and out["loading"])
+    system = solve_system(loading, beam, out=out)
     return system
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     dimensions = {"outer": 0.030, "inner": 0.027, "length":2.4}
     material = get_materials_like("cfrp")[0]
     beam = HollowCyl(material, dimensions)
     loading = find_loading(find_weight(3, 6), beam)
     system = solve_system(loading, beam)
     fig, axs = plt.subplots(2,2)
-    make_all_charts(axs, system)
+    lines = init_charts(axs)
+    make_all_charts(lines, system)
     fig.tight_layout()
     plt.show()
\ No newline at end of file
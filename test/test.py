@@ -0,0 +1,227 @@
+"""
+Checks of the beam solvers and airfoil filename classification
+
+Usage: `python test/test.py` or `python -m pytest test/test.py`
+from the repository root
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import unittest
+
+import numpy as np
+from scipy.integrate import cumulative_trapezoid
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.orm import Session, undefer
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repo_dir, "airplane_design"))
+
+import structures
+from _kernels import solve_beam_nb
+from _regexes import filename_regexes, classify_filename
+from data import Airfoil, Base, Material, _dumps
+
+db_path = os.path.join(repo_dir, "data", "design.db")
+
+
+def make_material():
+    # not added to a session, so no database is needed
+    return Material(name="test cfrp", youngs_mod=70, youngs_mod_unit="GPa",
+                    density=1.6, density_unit="g/cc")
+
+def reference_system(loading, beam):
+    """ The beam equations with scipy: zero shear and moment at the tip,
+    zero angle and displacement at the center """
+    z = beam.zvals
+    center = len(z)//2
+    EI = beam.I_x * beam.material.get_youngs_mod()
+    shear = cumulative_trapezoid(loading, z, initial=0)
+    shear -= shear[0]
+    moment = cumulative_trapezoid(shear, z, initial=0)
+    moment -= moment[0]
+    angle = cumulative_trapezoid(moment, z, initial=0) / EI
+    angle -= angle[center]
+    disp = cumulative_trapezoid(angle, z, initial=0)
+    disp -= disp[center]
+    return {"shear": shear, "moment": moment, "angle": angle, "displacement": disp}
+
+
+class TestBeamSolvers(unittest.TestCase):
+    keys = ("shear", "moment", "angle", "displacement")
+
+    def setUp(self):
+        self.material = make_material()
+        self.beams = [
+            structures.HollowCyl(self.material, {"outer": 0.030, "inner": 0.027, "length": 2.4}),
+            structures.HollowCyl(self.material, {"outer": 0.025, "inner": 0.020, "length": 1.7}, nzvals=501),
+        ]
+
+    def assertArraysClose(self, actual, expected, rtol=1e-12):
+        self.assertEqual(np.shape(actual), np.shape(expected))
+        scale = np.abs(expected).max()
+        self.assertLessEqual(np.abs(actual - expected).max(), rtol * scale)
+
+    def test_solve_beam_nb_matches_scipy(self):
+        for beam in self.beams:
+            loading = structures.find_loading(structures.find_weight(3, 6), beam)
+            out = structures.make_buffers(beam.nzvals)
+            EI = beam.I_x * beam.material.get_youngs_mod()
+            max_moment = solve_beam_nb(loading, beam.dz, EI, *(out[key] for key in self.keys))
+            expected = reference_system(loading, beam)
+            for key in self.keys:
+                self.assertArraysClose(out[key], expected[key])
+            self.assertAlmostEqual(max_moment, expected["moment"].max(), delta=1e-12 * max_moment)
+
+    def test_find_functions_match_scipy(self):
+        for beam in self.beams:
+            loading = structures.find_loading(structures.find_weight(3, 6), beam)
+            shear = structures.find_shear(loading, beam)
+            moment = structures.find_moment(shear, beam)
+            angle = structures.find_angle(moment, beam)
+            disp = structures.find_displacement(angle, beam)
+            expected = reference_system(loading, beam)
+            for key, actual in zip(self.keys, (shear, moment, angle, disp)):
+                self.assertArraysClose(actual, expected[key])
+
+    def test_solve_system_matches_scipy(self):
+        for beam in self.beams:
+            loading = structures.find_loading(structures.find_weight(3, 6), beam)
+            system = structures.solve_system(loading, beam)
+            expected = reference_system(loading, beam)
+            for key in self.keys:
+                self.assertArraysClose(system[key], expected[key])
+            self.assertAlmostEqual(system["max_stress"],
+                                   expected["moment"].max() / beam.section_modulus,
+                                   delta=1e-12 * system["max_stress"])
+
+    def test_loading_is_balanced(self):
+        for beam in self.beams:
+            loading = structures.find_loading(100.0, beam)
+            self.assertLessEqual(abs(loading.sum()), 1e-12 * np.abs(loading).sum())
+
+    def test_solve_system_batch_matches_solve_system(self):
+        outer = np.linspace(0.02, 0.05, 130)
+        length = np.linspace(1.5, 3.0, 130)
+        weight = structures.find_weight(np.linspace(2, 6, 130), 6)
+        batch = structures.BeamBatch(self.material, outer, 0.9 * outer, length, nzvals=400)
+        results = structures.solve_system_batch(structures.find_loading(weight, batch), batch)
+        for j in range(len(outer)):
+            beam = structures.HollowCyl(self.material, {"outer": outer[j], "inner": 0.9 * outer[j],
+                                                        "length": length[j]}, nzvals=400)
+            system = structures.solve_system(structures.find_loading(weight[j], beam), beam)
+            for key in ("loading",) + self.keys:
+                self.assertArraysClose(results[key][:, j], system[key])
+            self.assertAlmostEqual(results["max_stress"][j], system["max_stress"],
+                                   delta=1e-12 * system["max_stress"])
+
+    def test_batch_from_beams(self):
+        batch = structures.BeamBatch.from_beams(self.beams[:1] * 3)
+        np.testing.assert_allclose(batch.I_x, self.beams[0].I_x)
+        np.testing.assert_allclose(batch.mass, self.beams[0].mass)
+        with self.assertRaises(ValueError):
+            structures.BeamBatch.from_beams(self.beams)
+
+    def test_cumtrapz_matches_scipy(self):
+        rng = np.random.default_rng(0)
+        x = np.sort(rng.random(300))
+        y = np.sin(5 * x)
+        self.assertArraysClose(structures.cumtrapz(y, x), cumulative_trapezoid(y, x, initial=0))
+
+    def test_mismatched_buffers_raise(self):
+        # the compiled kernels don't bounds-check, so shapes are checked first
+        beam = structures.HollowCyl(self.material, {"outer": 0.03, "inner": 0.027, "length": 2.4},
+                                    nzvals=200000)
+        loading = structures.find_loading(100.0, beam)
+        with self.assertRaises(ValueError):
+            structures.solve_system(loading, beam, out=structures.make_buffers(1000))
+        batch = structures.BeamBatch(self.material, [0.03, 0.04], [0.027, 0.035], 2.4, nzvals=100)
+        with self.assertRaises(ValueError):
+            structures.solve_system_batch(np.ones((100, 3)), batch)
+        with self.assertRaises(ValueError):
+            structures.solve_system_batch(structures.find_loading(100.0, batch), batch,
+                                          out=structures.make_buffers(100))
+        with self.assertRaises(ValueError):
+            structures.cumtrapz(np.ones(10), np.arange(5.0))
+
+
+def classify_by_pattern(filename):
+    """ The unfused classifier: first family whose pattern matches the whole name """
+    for family, pattern in filename_regexes.items():
+        if re.fullmatch(pattern, filename):
+            return family
+    return None
+
+class TestClassifyFilename(unittest.TestCase):
+    def assertClassifiesLikePatterns(self, filenames):
+        for filename in filenames:
+            self.assertEqual(classify_filename(filename), classify_by_pattern(filename), filename)
+
+    def test_examples(self):
+        self.assertClassifiesLikePatterns(["naca2412", "e387", "s1223", "sd7037", "clarky",
+                                           "ag25", "rae2822", "usa35b", "v23010", "", "???"])
+
+    @unittest.skipUnless(os.path.exists(db_path), "no airfoil database")
+    def test_database_filenames(self):
+        # read-only, so the test never changes the database file
+        connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            filenames = [row[0] for row in connection.execute("SELECT filename FROM airfoils")]
+        finally:
+            connection.close()
+        self.assertTrue(filenames)
+        self.assertClassifiesLikePatterns(filenames)
+
+
+class TestAirfoilDeserialize(unittest.TestCase):
+    def setUp(self):
+        # in-memory database, so the tracked one is never touched
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        self.coordinates = np.array([[1.0, 0.0], [0.0, 0.0], [1.0, -0.01]])
+        self.session.add(Airfoil(title="test", filename="test", path="test.dat", extension=".dat",
+                                 family="test family", coordinates=self.coordinates,
+                                 upper_planform=self.coordinates[:2], lower_planform=self.coordinates[1:],
+                                 thickness=0.01, camber_line=self.coordinates))
+        self.session.commit()
+        self.airfoil = self.session.query(Airfoil).one()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_roundtrip(self):
+        airfoil_dict = self.airfoil.deserialize()
+        np.testing.assert_array_equal(airfoil_dict["coordinates"], self.coordinates)
+        # decoded once per stored value
+        self.assertIs(self.airfoil.deserialize()["coordinates"], airfoil_dict["coordinates"])
+
+    def test_assignment_before_flush(self):
+        self.airfoil.deserialize()
+        new = self.coordinates * 2
+        self.airfoil.coordinates = _dumps(new)
+        np.testing.assert_array_equal(self.airfoil.deserialize()["coordinates"], new)
+
+    def test_core_update(self):
+        self.airfoil.deserialize()
+        new = self.coordinates * 3
+        with self.engine.begin() as connection:
+            connection.execute(update(Airfoil.__table__).values(coordinates=_dumps(new)))
+        # the session sees the new row once its instances are expired, e.g. on commit
+        self.session.commit()
+        np.testing.assert_array_equal(self.airfoil.deserialize()["coordinates"], new)
+
+    def test_family_needs_no_extra_query(self):
+        self.session.expunge_all()
+        airfoils = self.session.scalars(select(Airfoil).options(undefer(Airfoil.family))).all()
+        queries = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: queries.append(args))
+        self.assertEqual(airfoils[0].deserialize()["family"], "test family")
+        self.assertEqual(queries, [])
+
+
+if __name__ == "__main__":
+    unittest.main()